@@ -32,6 +32,51 @@ DESCRIPTION
 
           Default output location: rules.out
 
+MAPREDUCE
+    When the baskets are sharded across several nodes, the frequent itemsets
+    can be found with the two-pass SON algorithm [1, Section 6.4.4] using the
+    "map" and "reduce" subcommands, e.g. as Hadoop streaming mapper/reducer.
+    The mappers and the pass 2 reducer write records to stdout as sortable
+    lines of the form
+
+      <items of the itemset, sorted, separated by spaces> TAB <count>
+
+    so that identical itemsets are adjacent after sorting. With a plain
+    sort, use LC_ALL=C so that the lines are sorted bytewise.
+
+    Pass 1: each mapper runs A-Priori on its shard with the support
+    threshold scaled down to the shard size and emits its locally frequent
+    itemsets. This needs the total number of baskets over all shards,
+    --total_baskets. A too small value gives a too high local threshold and
+    frequent itemsets may be missed; it is only rejected when a single
+    shard has more baskets than the total. The reducer emits each distinct
+    candidate itemset once, as a bare itemset line without TAB and count.
+
+    Pass 2: each mapper counts every candidate in its shard (--candidates)
+    and emits the counts, along with its number of baskets as the count of
+    the empty itemset. The reducer sums the counts and emits the itemsets
+    with support >= the support threshold whose subsets are all frequent,
+    along with the total number of baskets as the count of the empty
+    itemset, so that the rules can be computed from its output in a later
+    step.
+
+    The support threshold -s of map --phase 1 and reduce --phase 2 must be
+    the same, otherwise the result is wrong.
+
+    If --itemsets_out and/or --rules_out are given, the pass 2 reducer also
+    writes the frequent itemsets and association rules files as in the
+    single node case. This needs a single reducer, since the rules need all
+    the frequent itemsets.
+
+    Input is read from -i if given, or else from stdin. Both map and reduce
+    require --phase.
+
+    The result is the same as in the single node case, except that with
+    baskets containing the same item several times (counted once per
+    position) an itemset may be frequent over all the baskets without being
+    locally frequent in any shard, and then be missed. check_son.py runs
+    both and compares them.
+
 REFERENCES
     [1] Chapter 6 of "Mining of Massive Datasets" by Anand Rajaraman and 
         Jeff Ullman (accessible at http://i.stanford.edu/~ullman/mmds/book.pdf)
@@ -45,11 +90,25 @@ EXAMPLES
     # Run in check and verbose mode, and set support threshold to 500
     python a_priori.py -i in/browsing.txt -c -v -s 500
 
+    # Run the two MapReduce passes locally over shards in/shard_*, with the
+    # same support threshold in both passes
+    N=$(cat in/shard_* | wc -l)
+    for f in in/shard_*; do
+        python a_priori.py map --phase 1 -s 100 --total_baskets $N -i $f
+    done | LC_ALL=C sort | python a_priori.py reduce --phase 1 > candidates
+    for f in in/shard_*; do
+        python a_priori.py map --phase 2 --candidates candidates -i $f
+    done | LC_ALL=C sort | python a_priori.py reduce --phase 2 -s 100 \
+        --itemsets_out freq_itemsets.out --rules_out rules.out > freq_counts
+
 AUTHOR
     Parin Sripakdeevong <sripakpa@stanford.edu>
 """
 
+import itertools
+import shutil
 import sys
+import tempfile
 import time
 
 import optparse
@@ -74,30 +133,224 @@ def main():
     a_priori.output_rules(options.rules_outfile)
 
 
+def map_main(records_out):
+    """Emit the itemset counts of a single shard (SON map step) to the
+    records_out file object."""
+
+    global options
+
+    a_priori = APriori(options.check, options.verbose)
+
+    # A-Priori reads the baskets several times, so keep a copy of stdin.
+    spool = None
+
+    if options.data_file:
+        data_file = options.data_file
+    else:
+        spool = tempfile.NamedTemporaryFile()
+        shutil.copyfileobj(sys.stdin, spool)
+        spool.flush()
+        data_file = spool.name
+
+    if options.phase == 1:
+        # An itemset with support >= s over all the baskets must have
+        # support >= s * shard_basket / total_basket in at least one shard.
+        shard_basket = sum(1 for line in open(data_file, 'r'))
+
+        # A too small total gives a too high local threshold, which would
+        # drop globally frequent itemsets. Only a total smaller than the
+        # shard itself can be detected here.
+        if shard_basket > options.total_baskets:
+            sys.exit("a_priori.py: error: shard has %d baskets, " %
+                     shard_basket + "more than --total_baskets=%d" %
+                     options.total_baskets)
+
+        support_threshold = ((options.support_threshold * shard_basket +
+                              options.total_baskets - 1) //
+                             options.total_baskets)
+
+        if options.verbose:
+            print "shard_basket: %s" % shard_basket
+            print "local support_threshold: %s" % support_threshold
+
+        a_priori.set_support_threshold(support_threshold)
+
+        a_priori.compute_freq_itemsets(data_file)
+
+        counts = a_priori.freq_itemsets
+
+    else:
+        candidates = set(parse_record(line)[0]
+                         for line in open(options.candidates, 'r'))
+
+        counts = a_priori.count_itemsets(data_file, candidates)
+
+        # The number of baskets is the support of the empty itemset.
+        write_record(records_out, frozenset(), a_priori.total_basket)
+
+    for itemset in counts:
+        if len(itemset) > 0 and counts[itemset] > 0:
+            write_record(records_out, itemset, counts[itemset])
+
+    if spool is not None:
+        spool.close()
+
+
+def reduce_main(records_out):
+    """Merge the sorted itemset counts emitted by the mappers (SON reduce
+    step) and write the result to the records_out file object."""
+
+    global options
+
+    if options.data_file:
+        lines = open(options.data_file, 'r')
+    else:
+        lines = sys.stdin
+
+    records = itertools.groupby((parse_record(line) for line in lines),
+                                key=lambda record: record[0])
+
+    counted = set()
+    supports = dict()
+    total_basket = 0
+
+    for itemset, group in records:
+
+        if itemset in counted:
+            raise ValueError("Itemset %s is not contiguous, " % itemset +
+                             "reduce input must be sorted.")
+        counted.add(itemset)
+
+        if options.phase == 1:
+            # Every locally frequent itemset is a candidate.
+            if len(itemset) > 0:
+                records_out.write(format_itemset(itemset) + '\n')
+            continue
+
+        support = sum(count for _, count in group)
+
+        if len(itemset) == 0:
+            total_basket = support
+        elif support >= options.support_threshold:
+            supports[itemset] = support
+
+    if options.phase == 1:
+        return
+
+    # Items are counted per position in the basket, so with repeated items
+    # an itemset can reach the threshold while one of its subsets does not.
+    # Like get_doubletons() and get_tripletons(), only keep itemsets whose
+    # subsets are all frequent.
+    freq_itemsets = dict()
+
+    for itemset in sorted(supports, key=len):
+
+        if len(itemset) > 1:
+            subsets = [itemset.difference({item}) for item in itemset]
+
+            if not all(subset in freq_itemsets for subset in subsets):
+                continue
+
+        if options.verbose:
+            print "adding %s " % itemset,
+            print "with support %4d " % supports[itemset],
+            print "to freq_itemsets"
+
+        freq_itemsets[itemset] = supports[itemset]
+
+    write_record(records_out, frozenset(), total_basket)
+
+    for itemset in sorted(freq_itemsets, key=format_itemset):
+        write_record(records_out, itemset, freq_itemsets[itemset])
+
+    # Optionally also write the frequent itemsets and association rules
+    # files of the single node case. Requires a single reducer.
+    if options.itemsets_outfile is None and options.rules_outfile is None:
+        return
+
+    a_priori = APriori(options.check, options.verbose)
+
+    a_priori.set_freq_itemsets(freq_itemsets, total_basket)
+
+    if options.itemsets_outfile is not None:
+        a_priori.output_freq_itemsets(options.itemsets_outfile)
+
+    if options.rules_outfile is not None:
+        a_priori.compute_rules()
+
+        a_priori.output_rules(options.rules_outfile)
+
+
+def format_itemset(itemset):
+    """Items of the itemset, sorted and separated by spaces."""
+    return ' '.join(sorted(itemset))
+
+
+def parse_record(line):
+    """Parse a '<itemset> TAB <count>' line into (frozenset, count). The
+    count is optional and defaults to 0."""
+
+    key, _, count = line.rstrip('\n').partition('\t')
+
+    if count.strip():
+        count = int(count)
+    else:
+        count = 0
+
+    return frozenset(key.split()), count
+
+
+def write_record(records_out, itemset, count):
+    """Write a '<itemset> TAB <count>' line to the records_out file
+    object."""
+    records_out.write("%s\t%d\n" % (format_itemset(itemset), count))
+
+
 if __name__ == '__main__':
 
     start_time = time.time()
 
-    usage = 'python a_priori.py -i <infile>'
+    usage = ('python a_priori.py -i <infile>\n' +
+             '       python a_priori.py map|reduce --phase 1|2 [options]')
     parser = optparse.OptionParser(usage=usage + globals()['__doc__'])
 
     parser.add_option("-i", "--data_file",
                       action="store", type="string", dest="data_file",
-                      help="input basket data filename, required option")
+                      help="input basket data filename, required option " +
+                           "unless running map or reduce")
 
     parser.add_option("--itemsets_out", action="store", type="string",
-                      dest="itemsets_outfile", default="freq_itemsets.out",
-                      help="frequent itemsets output filename")
+                      dest="itemsets_outfile",
+                      help="frequent itemsets output filename " +
+                           "(default: freq_itemsets.out, not written by " +
+                           "reduce --phase 2 unless given)")
 
     parser.add_option("--rules_out", action="store", type="string",
-                      dest="rules_outfile", default="rules.out",
-                      help="association rules output filename")
+                      dest="rules_outfile",
+                      help="association rules output filename " +
+                           "(default: rules.out, not written by " +
+                           "reduce --phase 2 unless given)")
 
     parser.add_option("-s", "--support", action="store", type="int",
                       dest="support_threshold", default="100",
                       help="minimum support/count for itemset to be " +
                            "consider as frequent")
 
+    parser.add_option("--phase", action="store", type="int",
+                      dest="phase",
+                      help="SON pass (1 or 2) to run, required in map or " +
+                           "reduce mode")
+
+    parser.add_option("--total_baskets", action="store", type="int",
+                      dest="total_baskets",
+                      help="total number of baskets over all shards, " +
+                           "required for map --phase 1")
+
+    parser.add_option("--candidates", action="store", type="string",
+                      dest="candidates",
+                      help="candidate itemsets filename (output of reduce " +
+                           "--phase 1), required for map --phase 2")
+
     parser.add_option("-v", "--verbose", action="store_true", default=False,
                       dest="verbose", help="verbose output")
 
@@ -106,23 +359,68 @@ if __name__ == '__main__':
 
     (options, args) = parser.parse_args()
 
+    mode = None
+
+    if len(args) == 1 and args[0] in ('map', 'reduce'):
+        mode = args.pop()
+
     if len(args) != 0:
         parser.error("leftover arguments=%s" % args)
 
-    if not options.data_file:
+    if mode is None and not options.data_file:
         parser.error("option -i required")
 
+    if mode is None:
+        for option in ('phase', 'total_baskets', 'candidates'):
+            if getattr(options, option) is not None:
+                parser.error("option --%s requires map or reduce" % option)
+
+        if options.itemsets_outfile is None:
+            options.itemsets_outfile = "freq_itemsets.out"
+
+        if options.rules_outfile is None:
+            options.rules_outfile = "rules.out"
+
+    if mode is not None and options.phase not in (1, 2):
+        parser.error("option --phase 1 or 2 required for map and reduce")
+
+    if (mode == 'map' and options.phase == 1 and
+            (options.total_baskets is None or options.total_baskets <= 0)):
+        parser.error("option --total_baskets > 0 required for map --phase 1")
+
+    if mode == 'map' and options.phase == 2 and not options.candidates:
+        parser.error("option --candidates required for map --phase 2")
+
+    # Records go to the real stdout, passed explicitly to map_main() and
+    # reduce_main(). All other output, including the print statements of
+    # the APriori class in verbose mode, goes to stderr so that it does not
+    # mix with the records.
+    records_out = sys.stdout
+
+    if mode is not None:
+        sys.stdout = sys.stderr
+
     if options.verbose:
         print "-" * 50
         print time.asctime()
+        print "mode: %s" % mode
+        print "phase: %s" % options.phase
         print "data_file: %s" % options.data_file
         print "itemsets_outfile: %s" % options.itemsets_outfile
         print "rules_outfile: %s" % options.rules_outfile
         print "support_threshold: %s" % options.support_threshold
+        print "total_baskets: %s" % options.total_baskets
+        print "candidates: %s" % options.candidates
         print "check: %s" % options.check
         print "-" * 50
 
-    main()
+    if mode == 'map':
+        map_main(records_out)
+    elif mode == 'reduce':
+        reduce_main(records_out)
+    else:
+        main()
+
     if options.verbose:
         print time.asctime(),
         print ' | total_time = %.3f secs' % (time.time() - start_time)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import itertools
+
 
 class APriori(object):
     """APriori class
@@ -78,6 +80,84 @@ class APriori(object):
         self.freq_itemsets.update(freq_doubletons)
         self.freq_itemsets.update(freq_tripletons)
 
+    def set_freq_itemsets(self, freq_itemsets, total_basket):
+        """Set frequent itemsets that were counted elsewhere (e.g. merged
+        from several shards) so that rules can be computed from them.
+
+        Parameters
+        ----------
+        freq_itemsets: dictionary
+            maps the frequent itemsets (frozenset) to their support/count.
+            Every subset of a frequent itemset must also be present.
+
+        total_basket: integer
+            total number of baskets the itemsets were counted over.
+        """
+        self.freq_itemsets = freq_itemsets
+        self.total_basket = total_basket
+
+    def count_itemsets(self, data_file, candidates):
+        """Count the support of each candidate itemset in the data file.
+
+        Parameters
+        ----------
+        data_file: string
+            location of the basket data file, same format as in
+            compute_freq_itemsets().
+
+        candidates: set of frozenset
+            candidate itemsets of size 1, 2 or 3 to count.
+
+        Returns
+        -------
+        counts: dictionary
+            maps each candidate itemset to its support/count, whether or
+            not it reaches support_threshold.
+
+        Notes
+        -----
+        Also compute the total number of baskets. Items are counted per
+        position in the basket, the same way as in get_singletons(),
+        get_doubletons() and get_tripletons(), so the raw counts are the
+        same. Unlike compute_freq_itemsets(), no itemset is dropped because
+        one of its subsets is not frequent.
+        """
+
+        counts = dict.fromkeys(candidates, 0)
+
+        # Items that appear in some candidate of a given size. Any other item
+        # cannot be part of a candidate of that size.
+        candidate_items = dict()
+
+        for itemset in candidates:
+            candidate_items.setdefault(len(itemset), set()).update(itemset)
+
+        self.total_basket = 0
+
+        for line in open(data_file, 'r'):
+
+            basket = line.split()
+
+            self.total_basket += 1
+
+            for size in candidate_items:
+
+                items = [item for item in basket
+                         if item in candidate_items[size]]
+
+                for combination in itertools.combinations(items, size):
+
+                    itemset = frozenset(combination)
+
+                    # Ignore combinations containing the same item twice.
+                    if len(itemset) != size:
+                        continue
+
+                    if itemset in counts:
+                        counts[itemset] += 1
+
+        return counts
+
     def output_freq_itemsets(self, output_filename):
         """Output frequent itemsets of sizes 2 and 3 to file.
 
@@ -89,17 +169,18 @@ class APriori(object):
         Notes
         -----
         One itemsets per line. Items in the itemset are seperated by
-        whitespace.
+        whitespace. Itemsets and items are sorted so that the output does
+        not depend on the dictionary order.
         """
 
         f = open(output_filename, 'w')
 
-        for itemsets in self.freq_itemsets:
+        for itemsets in sorted(self.freq_itemsets, key=sorted):
 
             if len(itemsets) == 1:  # ignore singletons
                 continue
 
-            for item in itemsets:
+            for item in sorted(itemsets):
                 f.write(item + ' ')
             f.write('\n')
 
@@ -150,7 +231,13 @@ class APriori(object):
 
         f = open(output_filename, 'w')
 
-        # sort the list of dictionary by confidence score
+        # Break ties on the score by the items of the rule, so that the
+        # output does not depend on the dictionary order.
+        self.rules = sorted(self.rules,
+                            key=lambda r: (sorted(r["A"]), sorted(r["B"])))
+
+        # sort the list of dictionary by confidence score (the sort is
+        # stable, so rules with the same score stay sorted by items)
         self.rules = sorted(self.rules, key=lambda r: r["conf"], reverse=True)
 
         f.write('top 10 confidence rules, (itemsets size = 2):\n')
@@ -506,13 +593,13 @@ class APriori(object):
             count += 1
 
             set_A_str = "{"
-            for item in rule["A"]:
+            for item in sorted(rule["A"]):
                 set_A_str += item + ", "
             set_A_str = set_A_str[:len(set_A_str) - 2]  # remove last ", ".
             set_A_str += "}"
 
             set_B_str = "{"
-            for item in rule["B"]:
+            for item in sorted(rule["B"]):
                 set_B_str += item + ", "
             set_B_str = set_B_str[:len(set_B_str) - 2]  # remove last ", ".
             set_B_str += "}"
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+SYNOPSIS
+    This script checks the map/reduce (SON) mode of a_priori.py against the
+    single node mode.
+
+DESCRIPTION
+    The basket file is split into shards of consecutive baskets. The two
+    map/reduce passes of a_priori.py are run over the shards, with one map
+    process per shard and the records sorted in between as in a
+    "sort | reduce" pipeline. a_priori.py is also run on the whole basket
+    file.
+
+    The script then checks that:
+
+      (1) the frequent itemsets and counts emitted by the pass 2 reducer
+          (including the total number of baskets) are the ones computed by
+          the APriori class on the whole basket file.
+
+      (2) the freq_itemsets.out and rules.out files of both runs are
+          identical. Both files are written in sorted order, with ties on
+          the rule scores broken by the items of the rule.
+
+    Exits with status 1 if any check fails.
+
+EXAMPLES
+    # Check with 4 shards
+    python check_son.py -i in/browsing.txt
+
+    # Check with 7 shards and support threshold set to 500
+    python check_son.py -i in/browsing.txt -n 7 -s 500
+
+AUTHOR
+    Parin Sripakdeevong <sripakpa@stanford.edu>
+"""
+
+import filecmp
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import optparse
+
+import a_priori
+from a_priori_class import APriori
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'a_priori.py')
+
+
+def main():
+
+    global options
+
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        passed = check(work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+
+    return passed
+
+
+def check(work_dir):
+    """Run both modes in work_dir and compare them."""
+
+    global options
+
+    shard_files = split_data_file(options.data_file, options.num_shards,
+                                  work_dir)
+
+    total_baskets = sum(1 for line in open(options.data_file, 'r'))
+
+    # Pass 1.
+    map_out = run_mappers(shard_files, ['--phase', '1',
+                                        '-s', str(options.support_threshold),
+                                        '--total_baskets',
+                                        str(total_baskets)])
+
+    candidates = run(['reduce', '--phase', '1'], map_out)
+
+    candidates_file = os.path.join(work_dir, 'candidates')
+    open(candidates_file, 'w').write(candidates)
+
+    # Pass 2.
+    map_out = run_mappers(shard_files, ['--phase', '2',
+                                        '--candidates', candidates_file])
+
+    son_itemsets_file = os.path.join(work_dir, 'son_freq_itemsets.out')
+    son_rules_file = os.path.join(work_dir, 'son_rules.out')
+
+    records = run(['reduce', '--phase', '2',
+                   '-s', str(options.support_threshold),
+                   '--itemsets_out', son_itemsets_file,
+                   '--rules_out', son_rules_file], map_out)
+
+    son_counts = dict(a_priori.parse_record(line)
+                      for line in records.splitlines())
+
+    # Single node.
+    itemsets_file = os.path.join(work_dir, 'freq_itemsets.out')
+    rules_file = os.path.join(work_dir, 'rules.out')
+
+    run(['-i', options.data_file,
+         '-s', str(options.support_threshold),
+         '--itemsets_out', itemsets_file,
+         '--rules_out', rules_file])
+
+    single_node = APriori()
+    single_node.set_support_threshold(options.support_threshold)
+    single_node.compute_freq_itemsets(options.data_file)
+
+    counts = dict(single_node.freq_itemsets)
+    counts[frozenset()] = single_node.total_basket
+
+    passed = True
+
+    if son_counts != counts:
+        print "FAILED: frequent itemset counts differ",
+        print "(%d with SON, %d single node)" % (len(son_counts) - 1,
+                                                 len(counts) - 1)
+        passed = False
+    else:
+        print "OK: %d frequent itemsets and counts" % (len(counts) - 1)
+
+    for son_file, single_file in [(son_itemsets_file, itemsets_file),
+                                  (son_rules_file, rules_file)]:
+
+        name = os.path.basename(single_file)
+
+        if filecmp.cmp(son_file, single_file, shallow=False):
+            print "OK: %s" % name
+        else:
+            print "FAILED: %s differs" % name
+            passed = False
+
+    return passed
+
+
+def split_data_file(data_file, num_shards, work_dir):
+    """Split data_file into num_shards files of consecutive baskets."""
+
+    lines = open(data_file, 'r').readlines()
+
+    shard_size = (len(lines) + num_shards - 1) // num_shards
+
+    shard_files = list()
+
+    for n in range(num_shards):
+
+        shard_file = os.path.join(work_dir, 'shard_%d' % n)
+
+        f = open(shard_file, 'w')
+        f.writelines(lines[n * shard_size:(n + 1) * shard_size])
+        f.close()
+
+        shard_files.append(shard_file)
+
+    return shard_files
+
+
+def run_mappers(shard_files, args):
+    """Run one map process per shard and return the sorted records."""
+
+    records = list()
+
+    for shard_file in shard_files:
+        records.extend(run(['map', '-i', shard_file] + args).splitlines(True))
+
+    # Same order as LC_ALL=C sort.
+    return ''.join(sorted(records))
+
+
+def run(args, stdin_data=None):
+    """Run a_priori.py with args and return its stdout."""
+
+    global options
+
+    if options.verbose:
+        print "running: a_priori.py %s" % ' '.join(args)
+
+    process = subprocess.Popen([sys.executable, SCRIPT] + args,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    stdout, _ = process.communicate(stdin_data)
+
+    if process.returncode != 0:
+        raise RuntimeError("a_priori.py %s " % ' '.join(args) +
+                           "exited with status %d" % process.returncode)
+
+    return stdout
+
+
+if __name__ == '__main__':
+
+    start_time = time.time()
+
+    usage = 'python check_son.py -i <infile>'
+    parser = optparse.OptionParser(usage=usage + globals()['__doc__'])
+
+    parser.add_option("-i", "--data_file",
+                      action="store", type="string", dest="data_file",
+                      help="input basket data filename, required option")
+
+    parser.add_option("-n", "--num_shards", action="store", type="int",
+                      dest="num_shards", default=4,
+                      help="number of shards to split the input into")
+
+    parser.add_option("-s", "--support", action="store", type="int",
+                      dest="support_threshold", default=100,
+                      help="minimum support/count for itemset to be " +
+                           "consider as frequent")
+
+    parser.add_option("-v", "--verbose", action="store_true", default=False,
+                      dest="verbose", help="verbose output")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) != 0:
+        parser.error("leftover arguments=%s" % args)
+
+    if not options.data_file:
+        parser.error("option -i required")
+
+    if options.num_shards <= 0:
+        parser.error("option -n must be > 0")
+
+    passed = main()
+
+    if options.verbose:
+        print time.asctime(),
+        print ' | total_time = %.3f secs' % (time.time() - start_time)
+
+    if passed:
+        sys.exit(0)
+    else:
+        sys.exit(1)